@@ -0,0 +1,105 @@
+import re
+
+# Every lookup costs at least a location search and a reviews request
+CALLS_PER_LOOKUP = 2
+
+MEAL_PREFIX = re.compile(r"^\s*(?:breakfast|brunch|lunch|dinner|dessert|snack|drinks)\s*[:\-–]\s*", re.IGNORECASE)
+
+# Explicit rules for entries that are not venues, checked in order as (reason, field, pattern).
+# The day rule looks at the extracted name: extract_places recovers the venue from
+# "Day 1 - Cafe Medina", so only a name that is still nothing but a day heading is dropped.
+NON_VENUE_RULES = [
+    ("day heading", "name", re.compile(r"^\W*day\s+\d+\b", re.IGNORECASE)),
+    # Titles such as "Vancouver Food Itinerary: May 12 - May 15" or "Itinerary for Paris"
+    ("itinerary title", "source_name", re.compile(r"\bitinerary\s*(?:$|[:\-–(]|for\b)", re.IGNORECASE)),
+    ("section heading", "source_name", re.compile(
+        r"^\W*(?:(?:travel|dining|practical|local)\s+)?(?:tips|notes|overview|summary"
+        r"|(?:local\s+)?(?:food\s+)?specialties|dining culture|reservations?)\W*$",
+        re.IGNORECASE)),
+]
+
+VAGUE_ADDRESS = re.compile(r"^\W*(?:multiple|various|several|varies|n/?a|tbd|tba|none|see )", re.IGNORECASE)
+
+ADDRESS_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "boulevard": "blvd", "drive": "dr",
+    "place": "pl", "lane": "ln", "court": "ct", "highway": "hwy", "square": "sq",
+    "west": "w", "east": "e", "north": "n", "south": "s", "suite": "ste",
+}
+
+
+def clean_name(name):
+    """Strip meal labels, Markdown emphasis and parenthetical notes to get a searchable venue name"""
+    name = name.replace("*", "").replace("_", " ")
+    name = MEAL_PREFIX.sub("", name)
+    name = re.sub(r"\s*\([^)]*\)", "", name)
+    return " ".join(name.split())
+
+
+def canonical_name(name):
+    name = clean_name(name).lower().replace("&", " and ")
+    name = re.sub(r"[^\w\s]", " ", name)
+    name = re.sub(r"^the\s+", "", name.strip())
+    return " ".join(name.split())
+
+
+def canonical_address(address):
+    address = address.lower().replace("&", " and ")
+    address = re.sub(r"[^\w\s]", " ", address)
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in address.split())
+
+
+def non_venue_reason(place):
+    """Return why an entry is not a venue, or None if it should be looked up"""
+    for reason, field, rule in NON_VENUE_RULES:
+        if rule.search(place.get(field) or place.get("name", "")):
+            return reason
+
+    if not clean_name(place.get("name", "")):
+        return "missing name"
+    address = place.get("address", "").strip()
+    if not address:
+        return "missing address"
+    if VAGUE_ADDRESS.search(address):
+        return "vague address"
+    return None
+
+
+def prepare_places(places):
+    """Drop non-venue entries and collapse duplicates so each venue is looked up once
+
+    Returns the kept places, each tagged with a "lookup_key", the unique lookups keyed the
+    same way, and a report of what was dropped and how many network calls were saved.
+    """
+    kept = []
+    lookups = {}
+    dropped = {}
+
+    for place in places:
+        reason = non_venue_reason(place)
+        if reason:
+            dropped[reason] = dropped.get(reason, 0) + 1
+            continue
+
+        key = (canonical_name(place["name"]), canonical_address(place["address"]))
+        if key not in lookups:
+            lookups[key] = {"name": clean_name(place["name"]), "address": place["address"].strip()}
+        kept.append(dict(place, lookup_key=key))
+
+    lookups_saved = len(places) - len(lookups)
+    report = {
+        "entries": len(places),
+        "dropped": sum(dropped.values()),
+        "dropped_by_reason": dropped,
+        "duplicates": len(kept) - len(lookups),
+        "lookups": len(lookups),
+        "lookups_saved": lookups_saved,
+        "calls_saved": lookups_saved * CALLS_PER_LOOKUP,
+    }
+    return kept, lookups, report
+
+
+def format_report(report):
+    reasons = ", ".join(f"{count} {reason}" for reason, count in report["dropped_by_reason"].items())
+    return (f"Prepared {report['entries']} entries: dropped {report['dropped']}"
+            f"{f' ({reasons})' if reasons else ''}, collapsed {report['duplicates']} duplicates "
+            f"into {report['lookups']} lookups, saving at least {report['calls_saved']} API calls")
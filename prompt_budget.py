@@ -0,0 +1,227 @@
+import functools
+import math
+import os
+import re
+
+# Per-call token budgets, each overridable with a PROMPT_BUDGET_<NAME> environment variable
+DEFAULT_BUDGETS = {
+    "total": 12000,      # whole revision prompt, template included
+    "itinerary": 8000,   # current itinerary Markdown
+    "history": 600,      # running summary of earlier change requests
+    "answer": 200,       # each trip detail answer
+    "itinerary_min": 1500,  # least itinerary context worth sending; below this the call is refused
+}
+
+FILLER_WORDS = {"please", "can", "could", "would", "you", "i", "i'd", "like", "to", "want", "the", "a", "an",
+                "also", "just", "maybe", "instead"}
+
+
+class PromptTooLongError(Exception):
+    """The fixed parts of a prompt leave too little room for the itinerary"""
+
+
+VERBOSE_LINE = re.compile(r"^\s*[-*]\s*\**\s*(?:why (?:it was |we )?selected|why|reservations?|tips?)\b",
+                          re.IGNORECASE)
+DESCRIPTION_LINE = re.compile(r"^(\s*[-*]\s*\**\s*description\**\s*:\s*)(.*)$", re.IGNORECASE)
+HEADING = re.compile(r"^(#{1,6})\s*(.*)$")
+# Whole heading text only, e.g. "Dining Culture Tips" or "Local Food Specialties to Try", never "Tipsy Cow Bar"
+VERBOSE_SECTION = re.compile(
+    r"^\W*(?:(?:local|food|travel|dining|practical|general)\s+)*(?:tips|culture|etiquette|specialties)"
+    r"(?:\s+(?:tips|and|&|to try|for|in|about)\b.*)?\W*$",
+    re.IGNORECASE)
+ADDRESS_LINE = re.compile(r"address\**\s*:", re.IGNORECASE)
+
+
+def load_budgets():
+    budgets = dict(DEFAULT_BUDGETS)
+    for name in budgets:
+        value = os.getenv(f"PROMPT_BUDGET_{name.upper()}")
+        if value:
+            try:
+                budgets[name] = int(value)
+            except ValueError:
+                print(f"Ignoring invalid PROMPT_BUDGET_{name.upper()}: {value}")
+    return budgets
+
+
+def estimate_tokens(text):
+    """Cheap offline estimate of roughly four characters per token"""
+    return math.ceil(len(text or "") / 4)
+
+
+def get_token_counter(llm=None):
+    """Pick the token counter set by PROMPT_TOKEN_COUNTER: "estimate" (default) or "model"
+
+    The model counter asks Gemini for exact counts, one request per distinct string, so
+    counts are cached and truncation works from a single count per section.
+    """
+    if llm is not None and os.getenv("PROMPT_TOKEN_COUNTER", "estimate").lower() == "model":
+        @functools.lru_cache(maxsize=1024)
+        def count_tokens(text):
+            try:
+                return llm.get_num_tokens(text or "")
+            except Exception:
+                return estimate_tokens(text)
+        return count_tokens
+    return estimate_tokens
+
+
+def truncate_to_tokens(text, budget, count_tokens=estimate_tokens):
+    """Cut text at a whitespace boundary so it fits the budget, keeping line breaks
+
+    The text is counted once and cut using its characters-per-token ratio.
+    """
+    text = text or ""
+    tokens = count_tokens(text)
+    if tokens <= budget:
+        return text
+    if budget <= 1:
+        return ""
+    # Leave a token for the trailing " ..."
+    limit = int(len(text) * (budget - 1) / tokens)
+    cut = text[:limit]
+    if limit < len(text) and not text[limit].isspace() and re.search(r"\s", cut):
+        cut = cut[:max(cut.rfind(" "), cut.rfind("\n"))]
+    return cut.rstrip() + " ..."
+
+
+def _first_sentence(text):
+    match = re.match(r"(.+?[.!?])(?:\s|$)", text)
+    return match.group(1) if match else text
+
+
+def _drop_verbose_sections(lines):
+    """Remove tip and culture sections, from their heading up to the next heading of the same level or higher
+
+    A section that holds an Address: line is a venue and is always kept.
+    """
+    headings = [(i, len(m.group(1)), m.group(2)) for i, m in
+                ((i, HEADING.match(line)) for i, line in enumerate(lines)) if m]
+    drop = set()
+    for k, (start, level, text) in enumerate(headings):
+        if not VERBOSE_SECTION.match(text):
+            continue
+        end = next((i for i, lvl, _ in headings[k + 1:] if lvl <= level), len(lines))
+        if not any(ADDRESS_LINE.search(line) for line in lines[start:end]):
+            drop.update(range(start, end))
+    return [line for i, line in enumerate(lines) if i not in drop]
+
+
+def compact_itinerary(markdown_text, budget, count_tokens=estimate_tokens):
+    """Shrink the itinerary in stages until it fits the budget
+
+    Names, addresses, cuisines and prices are kept; "why selected" and reservation notes go
+    first, then descriptions are cut to one sentence, then tip sections are dropped, and
+    only as a last resort is the text truncated.
+    """
+    markdown_text = markdown_text or ""
+    lines = markdown_text.splitlines()
+    # The route section is regenerated after every revision, so it is never sent back
+    for i, line in enumerate(lines):
+        if re.match(r"^#+\s*suggested routes", line, re.IGNORECASE):
+            lines = lines[:i - 1] if i and lines[i - 1].strip() == "---" else lines[:i]
+            break
+
+    stages = [
+        lambda ls: [line for line in ls if not VERBOSE_LINE.match(line)],
+        lambda ls: [DESCRIPTION_LINE.sub(lambda m: m.group(1) + _first_sentence(m.group(2)), line) for line in ls],
+        _drop_verbose_sections,
+        lambda ls: [line for line in ls if line.strip()],
+    ]
+    text = "\n".join(lines)
+    for stage in stages:
+        if count_tokens(text) <= budget:
+            return text
+        lines = stage(lines)
+        text = "\n".join(lines)
+
+    return truncate_to_tokens(text, budget, count_tokens)
+
+
+def _key_phrase(request, words):
+    """Condense a change request to its first few meaningful words"""
+    kept = [word for word in request.split() if word.lower().strip(",.!?") not in FILLER_WORDS]
+    phrase = " ".join(kept[:words]).rstrip(",.;:!?")
+    return phrase + ("..." if len(kept) > words else "")
+
+
+class ChangeHistory:
+    """Running record of the change requests made so far, rendered to fit a token budget"""
+
+    def __init__(self):
+        self.requests = []
+
+    def add(self, request):
+        self.requests.append(" ".join(request.split()))
+
+    def summary(self, budget, count_tokens=estimate_tokens):
+        """Summarize earlier requests within the budget without losing any of them
+
+        Recent requests are listed in full; once over budget, the oldest are folded into a
+        single line of key phrases, and those phrases are shortened further if needed.
+        """
+        if not self.requests:
+            return "None"
+
+        def render(folded, recent, phrase_words):
+            lines = []
+            if folded:
+                phrases = "; ".join(_key_phrase(request, phrase_words) for request in folded)
+                lines.append(f"Earlier ({len(folded)} requests, condensed): {phrases}")
+            lines += [f"{i}. {request}" for i, request in enumerate(recent, len(folded) + 1)]
+            return "\n".join(lines)
+
+        def size(folded, recent, phrase_words):
+            # Sized from the individual requests and phrases so each distinct string is counted
+            # once and later calls hit the counter's cache
+            total = sum(count_tokens(request) + 3 for request in recent)
+            if folded:
+                total += 8 + sum(count_tokens(_key_phrase(request, phrase_words)) + 1 for request in folded)
+            return total
+
+        for phrase_words in (8, 4, 2):
+            for split in range(len(self.requests)):
+                folded, recent = self.requests[:split], self.requests[split:]
+                if size(folded, recent, phrase_words) <= budget:
+                    return render(folded, recent, phrase_words)
+
+        return truncate_to_tokens(render(self.requests, [], 2), budget, count_tokens)
+
+
+def compact_revision_inputs(answers, itinerary, history, requested_changes, overhead_tokens=0,
+                            budgets=None, count_tokens=estimate_tokens):
+    """Fit the revision prompt inputs into the configured budgets
+
+    The latest change request is always sent in full. The history gives up room before the
+    itinerary drops below its minimum, and PromptTooLongError is raised if even that fails.
+    """
+    budgets = budgets or load_budgets()
+
+    compact_answers = {key: truncate_to_tokens(value, budgets["answer"], count_tokens)
+                       for key, value in answers.items()}
+    fixed = (overhead_tokens
+             + count_tokens(requested_changes)
+             + sum(count_tokens(value) for value in compact_answers.values()))
+
+    itinerary_min = min(budgets["itinerary_min"], budgets["itinerary"], count_tokens(itinerary))
+    history_budget = min(budgets["history"], budgets["total"] - fixed - itinerary_min)
+    if history_budget < 0:
+        raise PromptTooLongError(f"The request needs about {fixed} tokens, leaving too little room for "
+                                 f"the itinerary within the {budgets['total']} token budget")
+    change_history = history.summary(history_budget, count_tokens)
+
+    used = fixed + count_tokens(change_history)
+    itinerary_budget = max(itinerary_min, min(budgets["itinerary"], budgets["total"] - used))
+    current_itinerary = compact_itinerary(itinerary, itinerary_budget, count_tokens)
+
+    inputs = dict(compact_answers,
+                  requested_changes=requested_changes,
+                  change_history=change_history,
+                  current_itinerary=current_itinerary)
+    stats = {
+        "original_itinerary_tokens": count_tokens(itinerary),
+        "itinerary_tokens": count_tokens(current_itinerary),
+        "prompt_tokens": used + count_tokens(current_itinerary),
+        "budget": budgets["total"],
+    }
+    return inputs, stats
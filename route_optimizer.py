@@ -0,0 +1,332 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+import requests
+
+CACHE_PATH = Path(__file__).parent / "geocode_cache.json"
+EARTH_RADIUS_KM = 6371.0
+# Seconds spent geocoding per itinerary before the remaining stops are left unplaced
+DEFAULT_TIME_LIMIT = 20.0
+# Google Maps URLs honour at most 9 waypoints, so one link covers at most 11 stops
+MAX_WAYPOINTS = 9
+
+
+class GeocodingError(Exception):
+    """A lookup failed for a transient reason and should be retried later rather than cached"""
+
+
+class NominatimGeocoder:
+    """Geocode addresses through the OpenStreetMap Nominatim search API"""
+
+    url = "https://nominatim.openstreetmap.org/search"
+
+    def __init__(self, user_agent="travel-food-planner", min_interval=1.0):
+        self.user_agent = user_agent
+        # Nominatim's usage policy allows at most one request per second
+        self.min_interval = min_interval
+        self._last_request = 0.0
+
+    def geocode(self, address):
+        wait = self.min_interval - (time.monotonic() - self._last_request)
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+
+        try:
+            response = requests.get(
+                self.url,
+                params={"q": address, "format": "json", "limit": 1},
+                headers={"User-Agent": self.user_agent},
+                timeout=10
+            )
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GeocodingError(f"Geocoding error for {address}: {e}") from e
+
+        # Only an empty result means the address is unknown
+        if not data:
+            return None
+        try:
+            return float(data[0]["lat"]), float(data[0]["lon"])
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise GeocodingError(f"Unexpected geocoding response for {address}: {e}") from e
+
+
+class OfflineGeocoder:
+    """Deterministic stand-in that maps each address to a stable point without any network access"""
+
+    def __init__(self, center=(49.2827, -123.1207), spread_km=10.0):
+        self.center = center
+        self.spread_km = spread_km
+
+    def geocode(self, address):
+        digest = hashlib.sha256(address.strip().lower().encode("utf-8")).digest()
+        # Two 32-bit values in [-1, 1) give the north and east offsets
+        north = int.from_bytes(digest[:4], "big") / 2 ** 31 - 1
+        east = int.from_bytes(digest[4:8], "big") / 2 ** 31 - 1
+        lat = self.center[0] + north * self.spread_km / 111.0
+        lon = self.center[1] + east * self.spread_km / (111.0 * math.cos(math.radians(self.center[0])))
+        return lat, lon
+
+
+class CachedGeocoder:
+    """Wrap a geocoding provider with a JSON file cache keyed by normalized address"""
+
+    def __init__(self, provider, cache_path=CACHE_PATH):
+        self.provider = provider
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.cache = self._load_cache()
+        self._dirty = False
+        # Held across provider calls so concurrent workers share the provider's rate limit
+        self._lock = threading.Lock()
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def geocode(self, address):
+        """Return cached coordinates, or ask the provider and cache its answer
+
+        GeocodingError from the provider propagates without touching the cache.
+        """
+        key = " ".join(address.lower().split())
+        with self._lock:
+            if key in self.cache:
+                cached = self.cache[key]
+                return tuple(cached) if cached else None
+
+            coords = self.provider.geocode(address)
+            self.cache[key] = list(coords) if coords else None
+            self._dirty = True
+            return coords
+
+    def save(self):
+        with self._lock:
+            if not self.cache_path or not self._dirty:
+                return
+            try:
+                with open(self.cache_path, "w", encoding="utf-8") as f:
+                    json.dump(self.cache, f, indent=2)
+                self._dirty = False
+            except OSError as e:
+                print(f"Error saving geocode cache: {e}")
+
+
+_geocoders = {}
+_geocoders_lock = threading.Lock()
+
+
+def get_geocoder(provider=None, cache_path=CACHE_PATH):
+    """Return the shared cached geocoder selected by name or the GEOCODER_PROVIDER environment variable
+
+    One instance per provider and cache file is shared by all workers, so they use a single
+    rate limit and a single in-memory cache.
+    """
+    provider = (provider or os.getenv("GEOCODER_PROVIDER", "nominatim")).lower()
+    providers = {
+        "nominatim": NominatimGeocoder,
+        "offline": OfflineGeocoder,
+    }
+    if provider not in providers:
+        raise ValueError(f"Unknown geocoder provider: {provider}")
+    with _geocoders_lock:
+        key = (provider, str(cache_path) if cache_path else None)
+        if key not in _geocoders:
+            _geocoders[key] = CachedGeocoder(providers[provider](), cache_path)
+        return _geocoders[key]
+
+
+def haversine_km(a, b):
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def route_length(points, order):
+    return sum(haversine_km(points[order[i]], points[order[i + 1]]) for i in range(len(order) - 1))
+
+
+def _two_opt(order, dist):
+    """Reverse order[i..j] while that shortens the open path; the start stays fixed"""
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = order[i - 1], order[i]
+            for j in range(i + 1, n):
+                c = order[j]
+                d = order[j + 1] if j + 1 < n else None
+                delta = dist[a][c] - dist[a][b]
+                if d is not None:
+                    delta += dist[b][d] - dist[c][d]
+                if delta < -1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    b = order[i]
+                    improved = True
+    return order
+
+
+def solve_route(points):
+    """Order points as an open path starting at the first one
+
+    2-opt is run from a nearest neighbour tour and from the given order, and the shorter
+    result wins, so the answer is never longer than the planned order. It is a local
+    optimum, not necessarily the shortest possible route.
+    """
+    n = len(points)
+    if n < 3:
+        return list(range(n))
+
+    dist = [[haversine_km(p, q) for q in points] for p in points]
+
+    # Nearest neighbour construction from the first stop
+    nearest_first = [0]
+    remaining = set(range(1, n))
+    while remaining:
+        last = dist[nearest_first[-1]]
+        nearest = min(remaining, key=last.__getitem__)
+        nearest_first.append(nearest)
+        remaining.remove(nearest)
+
+    candidates = [_two_opt(nearest_first, dist), _two_opt(list(range(n)), dist)]
+    return min(candidates, key=lambda order: sum(dist[order[k]][order[k + 1]] for k in range(n - 1)))
+
+
+def get_directions_link(addresses):
+    """Build a single multi-stop Google Maps directions link visiting the addresses in order"""
+    if not addresses:
+        return ""
+    if len(addresses) == 1:
+        return f"https://www.google.com/maps/search/?api=1&query={quote(addresses[0])}"
+
+    link = (f"https://www.google.com/maps/dir/?api=1"
+            f"&origin={quote(addresses[0])}"
+            f"&destination={quote(addresses[-1])}")
+    if len(addresses) > 2:
+        link += f"&waypoints={quote('|'.join(addresses[1:-1]))}"
+    return link
+
+
+def get_directions_links(addresses):
+    """Split a route into consecutive directions links that each fit the waypoint limit
+
+    Each link starts where the previous one ends, so together they cover every stop.
+    """
+    if len(addresses) <= MAX_WAYPOINTS + 2:
+        return [get_directions_link(addresses)] if addresses else []
+    step = MAX_WAYPOINTS + 1
+    return [get_directions_link(addresses[start:start + step + 1])
+            for start in range(0, len(addresses) - 1, step)]
+
+
+def get_time_limit():
+    try:
+        return float(os.getenv("GEOCODE_TIME_LIMIT", DEFAULT_TIME_LIMIT))
+    except ValueError:
+        return DEFAULT_TIME_LIMIT
+
+
+def optimize_routes(restaurants, geocoder=None, time_limit=None, cancel=None):
+    """Plan the shortest visiting order of each day's restaurants and a directions link per day
+
+    Geocoding stops after time_limit seconds (GEOCODE_TIME_LIMIT by default); stops not placed
+    by then keep their order at the end of their day. Setting the optional cancel event stops
+    the work early and returns None.
+    """
+    geocoder = geocoder or get_geocoder()
+    deadline = time.monotonic() + (get_time_limit() if time_limit is None else time_limit)
+    timed_out = False
+
+    days = {}
+    for index, restaurant in enumerate(restaurants):
+        days.setdefault(restaurant.get("day"), []).append(index)
+
+    routes = []
+    for day, indices in days.items():
+        stops = [i for i in indices if restaurants[i].get("address")]
+        coords = {}
+        for i in stops:
+            if cancel is not None and cancel.is_set():
+                if hasattr(geocoder, "save"):
+                    geocoder.save()
+                return None
+            if time.monotonic() > deadline:
+                timed_out = True
+                break
+            try:
+                point = geocoder.geocode(restaurants[i]["address"])
+            except GeocodingError as e:
+                print(e)
+                continue
+            if point:
+                coords[i] = point
+
+        located = [i for i in stops if i in coords]
+        points = [coords[i] for i in located]
+        planned = list(range(len(points)))
+        path = solve_route(points)
+        original_km = route_length(points, planned)
+        optimized_km = route_length(points, path)
+        # Only suggest a new order when it is actually shorter, by at least 10 m
+        if optimized_km > original_km - 0.01:
+            path, optimized_km = planned, original_km
+        order = [located[k] for k in path]
+        # Stops that could not be geocoded keep their place at the end of the day
+        order += [i for i in stops if i not in coords]
+
+        routes.append({
+            "day": day,
+            "stops": [restaurants[i]["name"] for i in order],
+            "original_stops": [restaurants[i]["name"] for i in stops],
+            "reordered": path != planned,
+            "original_km": round(original_km, 2),
+            "optimized_km": round(optimized_km, 2),
+            "directions_links": get_directions_links([restaurants[i]["address"] for i in order])
+        })
+
+    if timed_out:
+        print("Geocoding time limit reached; some stops were left unplaced")
+    if hasattr(geocoder, "save"):
+        geocoder.save()
+
+    return routes
+
+
+def format_routes_markdown(routes):
+    """Render the optimized routes as a Markdown section to append to the itinerary"""
+    lines = ["---", "## Suggested Routes"]
+    for route in routes:
+        if len(route["stops"]) < 2:
+            continue
+        title = f"Day {route['day']}" if route["day"] is not None else "Trip overview"
+        lines.append(f"### {title} route")
+        if route["reordered"]:
+            lines.append(f"Visiting in this order saves about "
+                         f"{route['original_km'] - route['optimized_km']:.1f} km "
+                         f"({route['optimized_km']:.1f} km instead of {route['original_km']:.1f} km):")
+        else:
+            lines.append(f"No shorter order than the planned one was found ({route['optimized_km']:.1f} km):")
+        lines.extend(f"{i}. {stop}" for i, stop in enumerate(route["stops"], 1))
+        links = route["directions_links"]
+        if len(links) == 1:
+            lines.append(f"\n[Open directions in Google Maps]({links[0]})")
+        else:
+            lines.append(f"\nGoogle Maps links hold at most {MAX_WAYPOINTS + 2} stops, so this route is split "
+                         f"into {len(links)} parts: "
+                         + " · ".join(f"[Part {i}]({link})" for i, link in enumerate(links, 1)))
+    return "\n".join(lines) if len(lines) > 2 else ""
@@ -13,8 +13,12 @@ import webbrowser
 import requests
 import re
 import subprocess
+import threading
 from pathlib import Path
 from urllib.parse import quote
+from route_optimizer import optimize_routes, format_routes_markdown
+from prompt_budget import (ChangeHistory, PromptTooLongError, compact_revision_inputs, get_token_counter,
+                           load_budgets)
 
 load_dotenv()
 google_key = os.getenv("GOOGLE_API_KEY")
@@ -46,11 +50,17 @@ class StyledConversationPlanner:
         self.ask_next_question()
         self.itinerary_json = None
         self.last_html = None
+        self.last_markdown = None
+        self.route_request = 0
+        self.route_cancel = None
+        self.change_history = ChangeHistory()
+        self.prompt_budgets = load_budgets()
         self.waiting_for_changes = False
 
         # Initialize LLM with error handling
         try:
             self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7, google_api_key=google_key)
+            self.count_tokens = get_token_counter(self.llm)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to initialize AI: {str(e)}")
             self.root.destroy()
@@ -217,8 +227,7 @@ class StyledConversationPlanner:
 
         try:
             # Create a prompt to modify the existing itinerary
-            prompt_template = ChatPromptTemplate.from_messages([
-                SystemMessage(content="""
+            system_prompt = """
                     You are an expert travel food planner that modifies existing itineraries based on user feedback.
                     Your responses should be in Markdown format with clear organization and helpful details.
                     For each restaurant, clearly include the name and address in this format:
@@ -228,11 +237,14 @@ class StyledConversationPlanner:
                     - Cuisine: Type of cuisine
                     - Price range: $, $$, $$$, etc.
                     - Description: Brief description
-                """),
-                HumanMessagePromptTemplate.from_template("""
+                """
+            human_prompt = """
                     Please modify the following food itinerary based on these requested changes:
                     {requested_changes}
 
+                    Changes already made in earlier revisions (keep them in place):
+                    {change_history}
+
                     Original Itinerary Details:
                     - Destination: {destination}
                     - Dates: {dates}
@@ -243,7 +255,7 @@ class StyledConversationPlanner:
                     - Experience: {experience}
                     - Additional notes: {additional_notes}
 
-                    Here is the current itinerary (in Markdown format):
+                    Here is the current itinerary (in Markdown format, verbose details may be shortened):
                     {current_itinerary}
 
                     Please:
@@ -251,26 +263,48 @@ class StyledConversationPlanner:
                     2. Keep the same Markdown formatting
                     3. Explain any significant changes made
                     4. Maintain all the original information that wasn't requested to change
-                """)
+                    5. Write full descriptions, selection reasons and tips even where the itinerary above was shortened
+                """
+            prompt_template = ChatPromptTemplate.from_messages([
+                SystemMessage(content=system_prompt),
+                HumanMessagePromptTemplate.from_template(human_prompt)
             ])
 
             chain = LLMChain(llm=self.llm, prompt=prompt_template)
 
-            # Get the current markdown content from the HTML
-            current_markdown = self.extract_markdown_from_html(self.last_html)
+            # Prefer the stored markdown; the HTML round trip loses formatting
+            current_markdown = self.last_markdown or self.extract_markdown_from_html(self.last_html)
+
+            # Fit the prompt into the token budget so each revision stays the same size
+            try:
+                inputs, _ = compact_revision_inputs(
+                    self.answers,
+                    current_markdown,
+                    self.change_history,
+                    user_input,
+                    overhead_tokens=self.count_tokens(system_prompt + human_prompt),
+                    budgets=self.prompt_budgets,
+                    count_tokens=self.count_tokens
+                )
+            except PromptTooLongError:
+                self.add_to_conversation("Planner",
+                                         "That change request is too long to apply without losing the current "
+                                         "itinerary. Please shorten it or split it into smaller changes.",
+                                         "warning")
+                self.user_input.delete("1.0", tk.END)
+                return
 
-            markdown_result = chain.run(
-                requested_changes=user_input,
-                current_itinerary=current_markdown,
-                **self.answers
-            )
+            markdown_result = chain.run(**inputs)
+            self.change_history.add(user_input)
+            self.last_markdown = markdown_result
 
             # Extract restaurant info
             restaurants = self.extract_restaurant_info(markdown_result)
             self.itinerary_json = json.dumps({
                 "destination": self.answers.get('destination', ''),
                 "dates": self.answers.get('dates', ''),
-                "restaurants": restaurants
+                "restaurants": restaurants,
+                "routes": []
             }, indent=2)
 
             # Writing to files for others to access
@@ -284,6 +318,7 @@ class StyledConversationPlanner:
             html_result = self.convert_markdown_to_html(processed_markdown)
             self.output_frame.load_html(html_result)
             self.last_html = html_result
+            self.plan_routes(restaurants)
 
             # Ask if more changes are needed
             self.add_to_conversation("Planner",
@@ -339,8 +374,15 @@ class StyledConversationPlanner:
 
     def extract_restaurant_info(self, markdown_text):
         """Extract restaurant information from markdown text and return as JSON with Google Maps links"""
-        pattern = r"###?\s*(.*?)\n.*?Address:\s*(.*?)(?:\n|$)"
-        matches = re.findall(pattern, markdown_text, re.IGNORECASE | re.DOTALL)
+        # Name and address must come from the same ### block, so day headings are never paired
+        # with the address of the first restaurant below them
+        pattern = r"^###\s+(.*)\n(?:(?!#).*\n)*?.*?Address:\**\s*(.*)$"
+        matches = re.finditer(pattern, markdown_text, re.IGNORECASE | re.MULTILINE)
+
+        # Positions of the "Day N" headings, used to tag each restaurant with its day
+        day_headings = [(m.start(), int(m.group(1)))
+                        for m in re.finditer(r"^#{1,3}\s*\**\s*Day\s+(\d+)", markdown_text,
+                                             re.IGNORECASE | re.MULTILINE)]
 
         def get_google_maps_link(address):
             if not address:
@@ -354,15 +396,69 @@ class StyledConversationPlanner:
             return f"https://www.google.com/maps/search/?api=1&query={formatted_address}"
 
         restaurants = []
-        for name, address in matches:
+        for match in matches:
+            name, address = match.groups()
+            day = None
+            for position, number in day_headings:
+                if position > match.start():
+                    break
+                day = number
             restaurants.append({
                 "name": name.strip(),
                 "address": address.strip(),
-                "maps_link": get_google_maps_link(address.strip())
+                "maps_link": get_google_maps_link(address.strip()),
+                "day": day
             })
 
         return restaurants
 
+    def plan_routes(self, restaurants):
+        """Optimize each day's restaurant order in the background and show the routes when ready"""
+        # Stop any worker still geocoding a replaced itinerary
+        if self.route_cancel is not None:
+            self.route_cancel.set()
+        cancel = threading.Event()
+        self.route_cancel = cancel
+        self.route_request += 1
+        request_id = self.route_request
+        result = {}
+
+        def worker():
+            try:
+                result["routes"] = optimize_routes(restaurants, cancel=cancel)
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        # Tk widgets may only be touched from the main thread, so poll for the result
+        def check_result():
+            if thread.is_alive():
+                self.root.after(200, check_result)
+                return
+            if request_id != self.route_request:
+                return  # A newer itinerary has replaced this one
+            if "error" in result:
+                self.add_to_conversation("Planner", f"Could not optimize the daily routes: {str(result['error'])}",
+                                         "warning")
+                return
+            self.show_routes(result["routes"])
+
+        self.root.after(200, check_result)
+
+    def show_routes(self, routes):
+        """Add the planned routes to the itinerary JSON and the displayed itinerary"""
+        itinerary = json.loads(self.itinerary_json)
+        itinerary["routes"] = routes
+        self.itinerary_json = json.dumps(itinerary, indent=2)
+
+        routes_markdown = format_routes_markdown(routes)
+        if routes_markdown and self.output_window is not None and self.output_window.winfo_exists():
+            html_result = self.convert_markdown_to_html(self.last_markdown + "\n\n" + routes_markdown)
+            self.output_frame.load_html(html_result)
+            self.last_html = html_result
+
     def generate_itinerary(self):
         try:
             if self.output_window is None or not self.output_window.winfo_exists():
@@ -429,13 +525,15 @@ class StyledConversationPlanner:
             chain = LLMChain(llm=self.llm, prompt=prompt_template)
 
             markdown_result = chain.run(**self.answers)
+            self.last_markdown = markdown_result
 
             # Extract restaurant info
             restaurants = self.extract_restaurant_info(markdown_result)
             self.itinerary_json = json.dumps({
                 "destination": self.answers.get('destination', ''),
                 "dates": self.answers.get('dates', ''),
-                "restaurants": restaurants
+                "restaurants": restaurants,
+                "routes": []
             }, indent=2)
 
             # Writing to files for others to access
@@ -451,6 +549,7 @@ class StyledConversationPlanner:
             html_result = self.convert_markdown_to_html(processed_markdown)
             self.output_frame.load_html(html_result)
             self.last_html = html_result
+            self.plan_routes(restaurants)
 
             # Ask if user wants to make changes
             self.add_to_conversation("Planner",
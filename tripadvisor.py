@@ -8,6 +8,7 @@ import re
 from pathlib import Path
 from dotenv import load_dotenv
 from urllib.parse import quote
+from enrichment import prepare_places, format_report
 
 load_dotenv()
 
@@ -30,18 +31,16 @@ def configure_styles():
 def extract_places(data):
     """Process raw JSON data according to extraction rules"""
     extracted = []
-    for i, place in enumerate(data):
-        # Ignore first item
-        if i == 0:
-            continue
-
+    for place in data:
         name = place["name"]
 
         if name.startswith("#") or name.startswith("Lunch") or name.startswith("Dinner"):
             extracted.append({
                 "name": name.split(": ", 1)[1].strip(),
                 "address": place["address"],
-                "maps_link": place["maps_link"]
+                "maps_link": place["maps_link"],
+                "source_name": name,
+                "day": place.get("day")
             })
 
         elif name.startswith("Day"):
@@ -51,7 +50,9 @@ def extract_places(data):
                 extracted.append({
                     "name": split_parts[1].strip() if len(split_parts) > 1 else name,  # Fallback to original if split fails
                     "address": place["address"],
-                    "maps_link": place["maps_link"]
+                    "maps_link": place["maps_link"],
+                    "source_name": name,
+                    "day": place.get("day")
                 })
             else:
                 continue
@@ -60,7 +61,9 @@ def extract_places(data):
             extracted.append({
                 "name": name,
                 "address": place["address"],
-                "maps_link": place["maps_link"]
+                "maps_link": place["maps_link"],
+                "source_name": name,
+                "day": place.get("day")
             })
 
     return extracted
@@ -77,7 +80,8 @@ def load_restaurants():
         return []
 
 
-places = load_restaurants()
+places, lookups, prep_report = prepare_places(load_restaurants())
+print(format_report(prep_report))
 API_KEY = os.getenv("TRIP_ADVISOR_API_KEY")
 
 
@@ -120,10 +124,12 @@ class RestaurantReviewApp:
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
+        # One lookup per unique venue, fanned back out to every occurrence
+        reviews = {key: self.get_reviews(lookup["name"], lookup["address"]) for key, lookup in lookups.items()}
         for place in places:
-            self.create_restaurant_card(scrollable_frame, place)
+            self.create_restaurant_card(scrollable_frame, place, reviews[place["lookup_key"]])
 
-    def create_restaurant_card(self, parent, place):
+    def create_restaurant_card(self, parent, place, reviews):
         card_frame = ttk.Frame(parent, relief=tk.RIDGE, borderwidth=1, padding=15)
         card_frame.pack(fill=tk.X, pady=10, padx=5, expand=True)
 
@@ -141,7 +147,6 @@ class RestaurantReviewApp:
             style='Address.TLabel'
         ).pack(anchor="w", pady=(5, 0), fill=tk.X)
 
-        reviews = self.get_reviews(place["name"], place["address"])
         if reviews:
             review_frame = ttk.Frame(card_frame)
             review_frame.pack(fill=tk.X, pady=(10, 0), expand=True)